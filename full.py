@@ -1,15 +1,199 @@
 # app.py
 import os
+import re
 import streamlit as st
 from dotenv import load_dotenv
-import json
-import requests
-from github import Github
 import time
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 
+from langchain_core.caches import InMemoryCache
+from langchain_core.globals import set_llm_cache
 from portia import (
     ToolRegistry, Config, LLMProvider, Portia, StorageClass, PlanRunState, tool
 )
+from portia.clarification import ClarificationCategory, UserVerificationClarification
+from portia.errors import ToolHardError
+from portia.execution_hooks import ExecutionHooks
+
+GITHUB_API_URL = "https://api.github.com"
+
+@st.cache_resource
+def github_session():
+    """Shared HTTP session for GitHub calls (survives Streamlit reruns)."""
+    # Imported lazily so a cold start doesn't pay for requests/urllib3 before the UI renders.
+    import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+
+    session = requests.Session()
+    session.mount("https://", HTTPAdapter(
+        pool_connections=4,
+        pool_maxsize=8,
+        max_retries=Retry(total=3, backoff_factor=0.3, status_forcelist=[502, 503, 504]),
+    ))
+    return session
+
+class VersionedCache:
+    """Bounded, thread-safe LRU map of key -> (version, value), e.g. PR -> (head_sha, diff)."""
+
+    def __init__(self, maxsize: int = 128):
+        self.maxsize = maxsize
+        self._entries: OrderedDict[tuple, tuple[str | None, object]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: tuple) -> tuple[str | None, object] | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key: tuple, version: str | None, value: object) -> None:
+        with self._lock:
+            self._entries[key] = (version, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+@st.cache_resource
+def diff_cache() -> VersionedCache:
+    """PR -> (head_sha, diff), shared across reruns and sessions."""
+    return VersionedCache(maxsize=128)
+
+@st.cache_resource
+def etag_cache() -> VersionedCache:
+    """PR -> (ETag, metadata payload), shared across reruns and sessions."""
+    return VersionedCache(maxsize=128)
+
+def fetch_pr_metadata(repo_name: str, pr_number: int, github_token: str) -> dict:
+    """Fetches the PR's REST representation (title, body, head commit, ...).
+
+    Sends the last ETag seen, so an unchanged PR costs a bodyless 304 that GitHub doesn't rate-limit.
+    """
+    key = (repo_name, pr_number, github_token)
+    cached = etag_cache().get(key)
+    headers = {'Authorization': f'token {github_token}', 'Accept': 'application/vnd.github+json'}
+    if cached is not None:
+        headers['If-None-Match'] = cached[0]
+    response = github_session().get(f"{GITHUB_API_URL}/repos/{repo_name}/pulls/{pr_number}", headers=headers)
+    if response.status_code == 304 and cached is not None:
+        return cached[1]
+    response.raise_for_status()
+    payload = response.json()
+    if response.headers.get("ETag"):
+        etag_cache().put(key, response.headers["ETag"], payload)
+    return payload
+
+# Diffs go straight into the LLM prompt, so keep them to a size the model can actually use.
+MAX_DIFF_BYTES = 200_000
+VENDORED_FILENAMES = ("package-lock.json", "yarn.lock", "pnpm-lock.yaml")
+VENDORED_SUFFIXES = (".min.js", ".min.css")
+
+def is_vendored(path: str) -> bool:
+    """Whether a diffed file is a lockfile, minified bundle or vendored dependency."""
+    return (
+        path.rsplit('/', 1)[-1] in VENDORED_FILENAMES
+        or path.endswith(VENDORED_SUFFIXES)
+        or path.startswith("node_modules/")
+        or "/node_modules/" in path
+    )
+
+def iter_diff_lines(response, line_limit):
+    """Yields the streamed body's lines as bytes, without their trailing newline.
+
+    Split by hand because requests' iter_lines(delimiter=...) yields a spurious empty line
+    whenever a read chunk happens to end exactly on the delimiter. A line that grows past
+    line_limit() bytes is yielded cut short and the rest of it is dropped unbuffered, so a single
+    huge line (a source map, a generated fixture) is never accumulated or copied whole.
+    """
+    pending = bytearray()
+    dropping = False
+    for chunk in response.iter_content(chunk_size=65536):
+        start = 0
+        while (end := chunk.find(b"\n", start)) != -1:
+            if dropping:
+                dropping = False
+            else:
+                pending += chunk[start:end]
+                yield bytes(pending)
+            pending.clear()
+            start = end + 1
+        if not dropping:
+            pending += chunk[start:]
+            if len(pending) > line_limit():
+                yield bytes(pending)
+                pending.clear()
+                dropping = True
+    if pending:
+        yield bytes(pending)
+
+def read_diff(response) -> str:
+    """Streams a diff, dropping vendored files and stopping once MAX_DIFF_BYTES have been kept."""
+    kept, kept_bytes = [], 0
+    skipped_hunks: dict[str, int] = {}
+    skipping, truncated = False, False
+    # Raw 64 KB reads that stop at the byte cap, even partway through a line: a line outgrowing the
+    # remaining budget comes back over-long and ends the loop. Lines stay bytes until the single
+    # decode below. The 4 KB floor keeps "diff --git" headers intact in skipped files near the cap.
+    for line in iter_diff_lines(response, lambda: max(MAX_DIFF_BYTES - kept_bytes, 4096)):
+        if line.startswith(b"diff --git "):
+            path = line.rsplit(b" b/", 1)[-1].decode("utf-8", errors="replace")
+            skipping = is_vendored(path)
+            if skipping:
+                skipped_hunks[path] = 0
+        if skipping:
+            if line.startswith(b"@@"):
+                skipped_hunks[path] += 1
+            continue
+        if kept_bytes + len(line) + 1 > MAX_DIFF_BYTES:
+            truncated = True
+            break
+        kept.append(line)
+        kept_bytes += len(line) + 1
+
+    # GitHub serves diffs as UTF-8, so decode as UTF-8 rather than trusting the response charset.
+    diff = b"\n".join(kept).decode("utf-8", errors="replace")
+    if skipped_hunks:
+        omitted = ", ".join(f"{path} ({hunks} hunks)" for path, hunks in skipped_hunks.items())
+        diff += f"\n...[vendored/generated files omitted: {omitted}]"
+    if truncated:
+        diff += f"\n...[diff truncated after {MAX_DIFF_BYTES // 1000} KB]"
+    return diff
+
+def fetch_pr_diff(repo_name: str, pr_number: int, github_token: str) -> str:
+    """Fetches the raw diff straight from the pulls endpoint."""
+    headers = {'Authorization': f'token {github_token}', 'Accept': 'application/vnd.github.diff'}
+    with github_session().get(f"{GITHUB_API_URL}/repos/{repo_name}/pulls/{pr_number}", headers=headers, stream=True) as response:
+        response.raise_for_status()
+        return read_diff(response)
+
+@st.cache_data(ttl=300, show_spinner=False)
+def fetch_pr(repo_name: str, pr_number: int, github_token: str) -> dict:
+    """Fetches title, body and diff for a PR, so Streamlit reruns don't hit GitHub again."""
+    key = (repo_name, pr_number, github_token)
+    cached = diff_cache().get(key)
+    if cached is None:
+        # First look at this PR, so there's no head SHA to gate on: fetch both at once.
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            metadata_future = executor.submit(fetch_pr_metadata, repo_name, pr_number, github_token)
+            diff_future = executor.submit(fetch_pr_diff, repo_name, pr_number, github_token)
+            pr = metadata_future.result()
+            diff_content = diff_future.result()
+        # A push can land between the two responses, so this diff isn't known to match head.sha.
+        # Cache it unversioned: the next fetch takes the sequential path and re-downloads it.
+        diff_sha = None
+    else:
+        # A diff never changes for a given head commit; only refetch it when the head moved.
+        pr = fetch_pr_metadata(repo_name, pr_number, github_token)
+        cached_sha, diff_content = cached
+        if cached_sha != pr['head']['sha']:
+            diff_content = fetch_pr_diff(repo_name, pr_number, github_token)
+        diff_sha = pr['head']['sha']
+    diff_cache().put(key, diff_sha, diff_content)
+    return {"title": pr['title'], "body": pr['body'], "diff": diff_content}
+
 @tool
 def get_pr_details_and_diff(repo_name: str, pr_number: int) -> str:
     """Gets the title, body, and code differences (diff) for a GitHub Pull Request."""
@@ -18,17 +202,21 @@ def get_pr_details_and_diff(repo_name: str, pr_number: int) -> str:
         return "Error: GITHUB_TOKEN has not been set. Please provide it in the sidebar."
     
     try:
-        g = Github(github_token)
-        repo = g.get_repo(repo_name)
-        pr = repo.get_pull(pr_number)
-        headers = {'Authorization': f'token {github_token}'}
-        response = requests.get(pr.patch_url, headers=headers)
-        response.raise_for_status()
-        diff_content = response.text
-        return f"Title: {pr.title}\nBody: {pr.body}\n\nCode Diff:\n{diff_content}"
+        pr = fetch_pr(repo_name, pr_number, github_token)
+        return f"Title: {pr['title']}\nBody: {pr['body']}\n\nCode Diff:\n{pr['diff']}"
     except Exception as e:
         return f"Error fetching PR details: {e}"
 
+def create_pr_comment(repo_name: str, pr_number: int, comment_body: str, github_token: str) -> None:
+    """Posts comment_body to the PR as-is; raises on any GitHub error."""
+    headers = {'Authorization': f'token {github_token}', 'Accept': 'application/vnd.github+json'}
+    response = github_session().post(
+        f"{GITHUB_API_URL}/repos/{repo_name}/issues/{pr_number}/comments",
+        json={"body": comment_body},
+        headers=headers,
+    )
+    response.raise_for_status()
+
 @tool
 def post_comment_to_pr(repo_name: str, pr_number: int, comment_body: str) -> str:
     """Posts a comment to a specific GitHub Pull Request."""
@@ -36,28 +224,57 @@ def post_comment_to_pr(repo_name: str, pr_number: int, comment_body: str) -> str
     if not github_token:
         return "Error: GITHUB_TOKEN has not been set. Please provide it in the sidebar."
     try:
-        g = Github(github_token)
-        repo = g.get_repo(repo_name)
-        pr = repo.get_pull(pr_number)
-        pr.create_issue_comment(comment_body)
+        create_pr_comment(repo_name, pr_number, comment_body, github_token)
         return "Comment posted successfully."
     except Exception as e:
         return f"Error posting comment: {e}"
 
+_PR_URL_RE = re.compile(r"^https?://github\.com/(?P<owner>[^/]+)/(?P<repo>[^/]+)/pull/(?P<number>\d+)/?$")
+
 def parse_pr_url(url: str) -> tuple[str, int]:
     """Parses a GitHub PR URL into (repo_name, pr_number)."""
-    try:
-        parts = url.strip('/').split('/')
-        repo_name = f"{parts[-4]}/{parts[-3]}"
-        pr_number = int(parts[-1])
-        return repo_name, pr_number
-    except (IndexError, ValueError) as e:
+    match = _PR_URL_RE.match(url.strip())
+    if not match:
         raise ValueError(f"Invalid GitHub PR URL format: {url}")
+    return f"{match['owner']}/{match['repo']}", int(match['number'])
 
 # --- Page Configuration ---
 st.set_page_config(page_title="Portia PR Guardian", page_icon="🛡️", layout="centered")
 
 # --- Agent Configuration ---
+def require_approval_before_posting(tool, args, plan_run, step):
+    """Pauses the plan run for the user's approval before a comment is posted.
+
+    The clarification carries the exact comment_body. On resume the agent regenerates the tool
+    arguments, so the call is refused unless they still match the text the user approved.
+    """
+    if tool.id != "post_comment_to_pr":
+        return None
+    approval = plan_run.get_clarification_for_step(ClarificationCategory.USER_VERIFICATION)
+    if approval is None or not approval.resolved:
+        return UserVerificationClarification(plan_run_id=plan_run.id, user_guidance=args["comment_body"])
+    if approval.response is not True:
+        raise ToolHardError("The user rejected the review comment.")
+    if args["comment_body"] != approval.user_guidance:
+        raise ToolHardError("The comment changed after it was approved; nothing was posted.")
+    return None
+
+@st.cache_resource
+def agent_progress() -> threading.local:
+    """Per-thread progress log for agent runs.
+
+    The agent is shared across sessions, so hooks find the calling session's log via the worker
+    thread. It's a cache_resource because the cached agent's hooks come from an earlier script run,
+    and a plain module global would be a different object on every rerun.
+    """
+    return threading.local()
+
+def report_step_progress(plan, plan_run, step, output):
+    """Records each finished plan step so the UI can show progress while the run is still going."""
+    log = getattr(agent_progress(), "log", None)
+    if log is not None:
+        log.append(step.task)
+
 @st.cache_resource
 def setup_portia_agent(google_key, portia_key):
     """Sets up the Portia agent."""
@@ -75,55 +292,170 @@ def setup_portia_agent(google_key, portia_key):
         get_pr_details_and_diff(),
         post_comment_to_pr(),
     ])
-    return Portia(config=guardian_config, tools=guardian_tool_registry)
+    return Portia(
+        config=guardian_config,
+        tools=guardian_tool_registry,
+        execution_hooks=ExecutionHooks(
+            before_tool_call=require_approval_before_posting,
+            after_step_execution=report_step_progress,
+        ),
+    )
+
+def warm_github_connection(github_token):
+    """Opens a pooled connection to api.github.com ahead of the first tool call."""
+    import requests
+
+    try:
+        headers = {'Authorization': f'token {github_token}', 'Accept': 'application/vnd.github+json'}
+        # /rate_limit is the cheapest authenticated endpoint and doesn't count against the limit.
+        github_session().get(f"{GITHUB_API_URL}/rate_limit", headers=headers, timeout=10)
+    except requests.RequestException:
+        pass  # Only an optimisation; any real problem surfaces on the first tool call.
+
+# --- Prompts ---
+# The fixed instructions are kept in one constant and only the PR reference varies, so reviewing
+# the same PR again yields a byte-identical task string for the LLM cache below to match on.
+REVIEW_INSTRUCTIONS = "Use `get_pr_details_and_diff` to fetch the pull request, analyze it for issues, and synthesize a review comment as markdown. Then use `post_comment_to_pr` to post exactly that markdown to the pull request."
+
+@st.cache_resource
+def enable_llm_cache():
+    """Serves byte-identical LLM prompts (e.g. re-reviewing an unchanged PR) from memory."""
+    set_llm_cache(InMemoryCache(maxsize=256))
+
+enable_llm_cache()
 
 # --- Agent Logic Functions ---
+def submit_agent_task(fn, *args):
+    """Runs an agent call on a worker thread so the Streamlit script never blocks on it."""
+    if "executor" not in st.session_state:
+        # Two workers so a fresh run can start while a cancelled one is still winding down.
+        st.session_state.executor = ThreadPoolExecutor(max_workers=2)
+    st.session_state.agent_progress = []
+    st.session_state.agent_future = st.session_state.executor.submit(
+        run_with_progress, st.session_state.agent_progress, fn, *args
+    )
+
+def run_with_progress(progress, fn, *args):
+    """Worker-side wrapper that points report_step_progress at this run's progress log."""
+    progress_local = agent_progress()
+    progress_local.log = progress
+    try:
+        return fn(*args)
+    finally:
+        progress_local.log = None
+
+def approve_and_resume(portia, plan_run, approval):
+    """Resolves the approval clarification and resumes the paused plan run, which posts the comment."""
+    plan_run = portia.resolve_clarification(approval, True, plan_run)
+    return portia.resume(plan_run)
+
 def run_analysis(pr_url):
-    st.session_state.messages.append({"role": "user", "content": f"Please review this PR: {pr_url}"})
-    portia = setup_portia_agent(st.session_state.google_api_key, st.session_state.portia_api_key)
-    
-    with st.chat_message("assistant", avatar="🛡️"):
-        with st.spinner("🔍 Analyzing the pull request..."):
-            try:
-                repo_name, pr_number = parse_pr_url(pr_url)
-                analysis_task = f"""Your first job is to analyze PR #{pr_number} in '{repo_name}'. Use `get_pr_details_and_diff`, analyze for issues, and synthesize a review comment. Your final output must be ONLY the markdown text of the draft comment."""
-                plan_run = portia.run(analysis_task)
-
-                if plan_run and plan_run.state == PlanRunState.COMPLETE and plan_run.outputs:
-                    outputs_dict = json.loads(plan_run.outputs.model_dump_json())
-                    draft = outputs_dict.get("final_output", {}).get("value")
-                    if draft:
-                        st.session_state.draft_comment = draft
-                        st.session_state.stage = "awaiting_approval"
-                    else:
-                        st.session_state.messages.append({"role": "assistant", "avatar": "🛡️", "content": "Agent failed to produce a draft."})
-                        st.session_state.stage = "initial"
-                else:
-                    st.session_state.messages.append({"role": "assistant", "avatar": "🛡️", "content": f"Agent run failed. State: {plan_run.state.value if plan_run else 'N/A'}"})
-                    st.session_state.stage = "initial"
-            except Exception as e:
-                st.session_state.messages.append({"role": "assistant", "avatar": "🛡️", "content": f"An error occurred: {e}"})
-                st.session_state.stage = "initial"
-
-def post_comment():
-    st.session_state.messages.append({"role": "user", "content": "Yes, approve and post."})
-    st.session_state.stage = "posting"
-    portia = setup_portia_agent(st.session_state.google_api_key, st.session_state.portia_api_key)
+    state = st.session_state
+    msgs = state.messages
+    google_key, portia_key = state.google_api_key, state.portia_api_key
+    msgs.append({"role": "user", "content": f"Please review this PR: {pr_url}"})
+    # A run paused on an earlier PR must never be resumed by this one's approval.
+    state.pop("plan_run", None)
+    state.pop("approval", None)
+    try:
+        repo_name, pr_number = parse_pr_url(pr_url)
+        review_task = f"{REVIEW_INSTRUCTIONS}\n\nReview PR #{pr_number} in '{repo_name}'."
+        portia = setup_portia_agent(google_key, portia_key)
+        submit_agent_task(portia.run, review_task)
+        state.stage = "analyzing"
+    except Exception as e:
+        msgs.append({"role": "assistant", "avatar": "🛡️", "content": f"An error occurred: {e}"})
+        state.stage = "initial"
 
-    with st.chat_message("assistant", avatar="🛡️"):
-        with st.spinner("🚀 Posting comment to GitHub..."):
-            try:
-                repo_name, pr_number = parse_pr_url(st.session_state.pr_url)
-                posting_task = f"Use `post_comment_to_pr` to post this comment to PR #{pr_number} in repo '{repo_name}':\n\n{st.session_state.draft_comment}"
-                plan_run = portia.run(posting_task)
-                
-                if plan_run and plan_run.state == PlanRunState.COMPLETE:
-                    st.session_state.messages.append({"role": "assistant", "avatar": "🛡️", "content": "✅ **Success!** Comment posted."})
-                else:
-                    st.session_state.messages.append({"role": "assistant", "avatar": "🛡️", "content": "❌ Failed to post the comment."})
-            except Exception as e:
-                st.session_state.messages.append({"role": "assistant", "avatar": "🛡️", "content": f"An error occurred while posting: {e}"})
-    st.session_state.stage = "done"
+def finish_analysis(future):
+    state = st.session_state
+    msgs = state.messages
+    try:
+        plan_run = future.result()
+
+        outstanding = []
+        if plan_run and plan_run.state == PlanRunState.NEED_CLARIFICATION:
+            outstanding = plan_run.get_outstanding_clarifications()
+
+        # Only the verification raised by require_approval_before_posting carries a draft; any other
+        # clarification (input, multiple choice, ...) is something this UI can't answer.
+        if len(outstanding) == 1 and outstanding[0].category == ClarificationCategory.USER_VERIFICATION:
+            approval = outstanding[0]
+            draft = approval.user_guidance
+            if draft:
+                state.plan_run = plan_run
+                state.approval = approval
+                state.draft_comment = draft
+                state.stage = "awaiting_approval"
+            else:
+                msgs.append({"role": "assistant", "avatar": "🛡️", "content": "Agent failed to produce a draft."})
+                state.stage = "initial"
+        elif plan_run and plan_run.state == PlanRunState.COMPLETE:
+            # The plan finished without ever reaching post_comment_to_pr (e.g. the planner left the
+            # post step out), so nothing was posted; its final output is the review draft.
+            final_output = plan_run.outputs.final_output
+            draft = final_output.value if final_output else None
+            if draft:
+                state.draft_comment = str(draft)
+                state.stage = "awaiting_approval"
+            else:
+                msgs.append({"role": "assistant", "avatar": "🛡️", "content": "The agent finished without producing a draft or reaching the approval step."})
+                state.stage = "initial"
+        else:
+            msgs.append({"role": "assistant", "avatar": "🛡️", "content": f"Agent run failed. State: {plan_run.state.value if plan_run else 'N/A'}"})
+            state.stage = "initial"
+    except Exception as e:
+        msgs.append({"role": "assistant", "avatar": "🛡️", "content": f"An error occurred: {e}"})
+        state.stage = "initial"
+
+def post_comment(user_message="Yes, approve and post."):
+    state = st.session_state
+    msgs = state.messages
+    google_key, portia_key = state.google_api_key, state.portia_api_key
+    msgs.append({"role": "user", "content": user_message})
+    try:
+        if "plan_run" in state:
+            portia = setup_portia_agent(google_key, portia_key)
+            submit_agent_task(approve_and_resume, portia, state.pop("plan_run"), state.pop("approval"))
+            state.stage = "posting"
+        else:
+            # No paused run left to resume (e.g. retrying after a failed post), so post the approved
+            # draft directly: it is exactly the text the user signed off on.
+            github_token = os.getenv("GITHUB_TOKEN")
+            if not github_token:
+                raise RuntimeError("GITHUB_TOKEN has not been set. Please provide it in the sidebar.")
+            repo_name, pr_number = parse_pr_url(state.pr_url)
+            create_pr_comment(repo_name, pr_number, state.draft_comment, github_token)
+            msgs.append({"role": "assistant", "avatar": "🛡️", "content": "✅ **Success!** Comment posted."})
+            state.stage = "done"
+    except Exception as e:
+        msgs.append({"role": "assistant", "avatar": "🛡️", "content": f"An error occurred while posting: {e}"})
+        state.stage = "post_failed"
+
+def plan_run_failure_reason(plan_run):
+    """The most useful explanation available for a plan run that didn't complete."""
+    if plan_run is None:
+        return "the agent returned no plan run"
+    final_output = plan_run.outputs.final_output
+    if final_output and final_output.value:
+        return str(final_output.value)
+    return f"the run ended in state {plan_run.state.value}"
+
+def finish_posting(future):
+    state = st.session_state
+    msgs = state.messages
+    try:
+        plan_run = future.result()
+
+        if plan_run and plan_run.state == PlanRunState.COMPLETE:
+            msgs.append({"role": "assistant", "avatar": "🛡️", "content": "✅ **Success!** Comment posted."})
+            state.stage = "done"
+        else:
+            msgs.append({"role": "assistant", "avatar": "🛡️", "content": f"❌ Failed to post the comment: {plan_run_failure_reason(plan_run)}"})
+            state.stage = "post_failed"
+    except Exception as e:
+        msgs.append({"role": "assistant", "avatar": "🛡️", "content": f"An error occurred while posting: {e}"})
+        state.stage = "post_failed"
 
 # --- Sidebar and Main UI ---
 with st.sidebar:
@@ -143,6 +475,9 @@ with st.sidebar:
             os.environ["GITHUB_TOKEN"] = github_token_input
             os.environ["PORTIA_API_KEY"] = portia_api_key_input
             st.session_state.keys_set = True
+            # Pay Portia's client start-up and the GitHub TLS handshake now, not on the first PR.
+            setup_portia_agent(google_api_key_input, portia_api_key_input)
+            threading.Thread(target=warm_github_connection, args=(github_token_input,), daemon=True).start()
             st.success("API keys ready!")
             time.sleep(1)
             st.rerun()
@@ -162,10 +497,47 @@ st.markdown("Your Portia AI agent is ready! Paste a GitHub Pull Request URL in t
 if "messages" not in st.session_state:
     st.session_state.messages = []
 
-for message in st.session_state.messages:
+# Only the most recent messages are rendered; older ones load on demand.
+MESSAGE_WINDOW = 50
+if "message_window" not in st.session_state:
+    st.session_state.message_window = MESSAGE_WINDOW
+
+hidden_messages = len(st.session_state.messages) - st.session_state.message_window
+if hidden_messages > 0 and st.button(f"Load earlier messages ({hidden_messages} hidden)", use_container_width=True):
+    st.session_state.message_window += MESSAGE_WINDOW
+    st.rerun()
+
+for message in st.session_state.messages[-st.session_state.message_window:]:
     with st.chat_message(message["role"], avatar=message.get("avatar")):
         st.markdown(message["content"])
 
+agent_running = st.session_state.get("stage") in ("analyzing", "posting")
+if agent_running and st.session_state.agent_future.done():
+    future = st.session_state.pop("agent_future")
+    if st.session_state.stage == "analyzing":
+        finish_analysis(future)
+    else:
+        finish_posting(future)
+    st.rerun()
+
+if st.session_state.get("stage") == "analyzing":
+    with st.chat_message("assistant", avatar="🛡️"):
+        st.markdown("🔍 Analyzing the pull request...")
+        for task in list(st.session_state.get("agent_progress", [])):
+            st.markdown(f"✔️ {task}")
+        if st.button("⏹️ Cancel", use_container_width=True):
+            # A run that has already started can't be interrupted; its result is simply discarded.
+            st.session_state.pop("agent_future").cancel()
+            st.session_state.messages.append({"role": "assistant", "avatar": "🛡️", "content": "🛑 Analysis cancelled."})
+            st.session_state.stage = "initial"
+            st.rerun()
+
+if st.session_state.get("stage") == "posting":
+    with st.chat_message("assistant", avatar="🛡️"):
+        st.markdown("🚀 Posting comment to GitHub...")
+        for task in list(st.session_state.get("agent_progress", [])):
+            st.markdown(f"✔️ {task}")
+
 if st.session_state.get("stage") == "awaiting_approval":
     with st.chat_message("assistant", avatar="🛡️"):
         st.markdown("📝 **Here is my draft review comment:**")
@@ -179,6 +551,25 @@ if st.session_state.get("stage") == "awaiting_approval":
         if col2.button("❌ Reject & Cancel", use_container_width=True):
             st.session_state.messages.append({"role": "user", "content": "No, reject."})
             st.session_state.messages.append({"role": "assistant", "avatar": "🛡️", "content": "👍 Understood. Operation cancelled."})
+            # The paused run is simply abandoned, so nothing is ever posted.
+            st.session_state.pop("plan_run", None)
+            st.session_state.pop("approval", None)
+            st.session_state.stage = "done"
+            st.rerun()
+
+if st.session_state.get("stage") == "post_failed":
+    # Keep the approved draft around so a failed post never loses it.
+    with st.chat_message("assistant", avatar="🛡️"):
+        st.markdown("⚠️ **The approved comment was not posted:**")
+        st.info(st.session_state.draft_comment)
+
+        col1, col2 = st.columns(2)
+        if col1.button("🔁 Retry Posting", use_container_width=True, type="primary"):
+            post_comment("Retry posting the approved comment.")
+            st.rerun()
+        if col2.button("🗑️ Discard", use_container_width=True):
+            st.session_state.messages.append({"role": "user", "content": "Discard it."})
+            st.session_state.messages.append({"role": "assistant", "avatar": "🛡️", "content": "👍 Understood. Comment discarded."})
             st.session_state.stage = "done"
             st.rerun()
 
@@ -187,5 +578,11 @@ if prompt:
     st.session_state.stage = "analyzing"
     st.session_state.pr_url = prompt
     st.session_state.messages = []
+    st.session_state.message_window = MESSAGE_WINDOW
     run_analysis(prompt)
     st.rerun()
+
+# Poll the background run: rerun shortly so its result shows up without user input.
+if agent_running:
+    time.sleep(0.5)
+    st.rerun()
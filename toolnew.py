@@ -1,31 +1,201 @@
 # tools.py
+import functools
 import os
-import requests
-from github import Github
+import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import streamlit as st
 from portia import tool
 
+GITHUB_API_URL = "https://api.github.com"
+
+@functools.cache
+def _session():
+    """One keep-alive pool for every tool call instead of a fresh TLS handshake each time.
+
+    requests is imported here rather than at module load so importing the tools stays cheap.
+    """
+    import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+
+    session = requests.Session()
+    session.mount("https://", HTTPAdapter(
+        pool_connections=4,
+        pool_maxsize=8,
+        max_retries=Retry(total=3, backoff_factor=0.3, status_forcelist=[502, 503, 504]),
+    ))
+    return session
+
+class _VersionedCache:
+    """Bounded, thread-safe LRU map of key -> (version, value), e.g. PR -> (head_sha, diff)."""
+
+    def __init__(self, maxsize: int = 128):
+        self.maxsize = maxsize
+        self._entries: OrderedDict[tuple, tuple[str | None, object]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: tuple) -> tuple[str | None, object] | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key: tuple, version: str | None, value: object) -> None:
+        with self._lock:
+            self._entries[key] = (version, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+_DIFF_CACHE = _VersionedCache(maxsize=128)
+_ETAG_CACHE = _VersionedCache(maxsize=128)
+
+def _fetch_pr_metadata(repo_name: str, pr_number: int, github_token: str) -> dict:
+    """Fetches the PR's REST representation (title, body, head commit, ...).
+
+    Sends the last ETag seen, so an unchanged PR costs a bodyless 304 that GitHub doesn't rate-limit.
+    """
+    key = (repo_name, pr_number, github_token)
+    cached = _ETAG_CACHE.get(key)
+    headers = {'Authorization': f'token {github_token}', 'Accept': 'application/vnd.github+json'}
+    if cached is not None:
+        headers['If-None-Match'] = cached[0]
+    response = _session().get(f"{GITHUB_API_URL}/repos/{repo_name}/pulls/{pr_number}", headers=headers)
+    if response.status_code == 304 and cached is not None:
+        return cached[1]
+    response.raise_for_status()
+    payload = response.json()
+    if response.headers.get("ETag"):
+        _ETAG_CACHE.put(key, response.headers["ETag"], payload)
+    return payload
+
+# Diffs go straight into the LLM prompt, so keep them to a size the model can actually use.
+MAX_DIFF_BYTES = 200_000
+VENDORED_FILENAMES = ("package-lock.json", "yarn.lock", "pnpm-lock.yaml")
+VENDORED_SUFFIXES = (".min.js", ".min.css")
+
+def _is_vendored(path: str) -> bool:
+    """Whether a diffed file is a lockfile, minified bundle or vendored dependency."""
+    return (
+        path.rsplit('/', 1)[-1] in VENDORED_FILENAMES
+        or path.endswith(VENDORED_SUFFIXES)
+        or path.startswith("node_modules/")
+        or "/node_modules/" in path
+    )
+
+def _iter_diff_lines(response, line_limit):
+    """Yields the streamed body's lines as bytes, without their trailing newline.
+
+    Split by hand because requests' iter_lines(delimiter=...) yields a spurious empty line
+    whenever a read chunk happens to end exactly on the delimiter. A line that grows past
+    line_limit() bytes is yielded cut short and the rest of it is dropped unbuffered, so a single
+    huge line (a source map, a generated fixture) is never accumulated or copied whole.
+    """
+    pending = bytearray()
+    dropping = False
+    for chunk in response.iter_content(chunk_size=65536):
+        start = 0
+        while (end := chunk.find(b"\n", start)) != -1:
+            if dropping:
+                dropping = False
+            else:
+                pending += chunk[start:end]
+                yield bytes(pending)
+            pending.clear()
+            start = end + 1
+        if not dropping:
+            pending += chunk[start:]
+            if len(pending) > line_limit():
+                yield bytes(pending)
+                pending.clear()
+                dropping = True
+    if pending:
+        yield bytes(pending)
+
+def _read_diff(response) -> str:
+    """Streams a diff, dropping vendored files and stopping once MAX_DIFF_BYTES have been kept."""
+    kept, kept_bytes = [], 0
+    skipped_hunks: dict[str, int] = {}
+    skipping, truncated = False, False
+    # Raw 64 KB reads that stop at the byte cap, even partway through a line: a line outgrowing the
+    # remaining budget comes back over-long and ends the loop. Lines stay bytes until the single
+    # decode below. The 4 KB floor keeps "diff --git" headers intact in skipped files near the cap.
+    for line in _iter_diff_lines(response, lambda: max(MAX_DIFF_BYTES - kept_bytes, 4096)):
+        if line.startswith(b"diff --git "):
+            path = line.rsplit(b" b/", 1)[-1].decode("utf-8", errors="replace")
+            skipping = _is_vendored(path)
+            if skipping:
+                skipped_hunks[path] = 0
+        if skipping:
+            if line.startswith(b"@@"):
+                skipped_hunks[path] += 1
+            continue
+        if kept_bytes + len(line) + 1 > MAX_DIFF_BYTES:
+            truncated = True
+            break
+        kept.append(line)
+        kept_bytes += len(line) + 1
+
+    # GitHub serves diffs as UTF-8, so decode as UTF-8 rather than trusting the response charset.
+    diff = b"\n".join(kept).decode("utf-8", errors="replace")
+    if skipped_hunks:
+        omitted = ", ".join(f"{path} ({hunks} hunks)" for path, hunks in skipped_hunks.items())
+        diff += f"\n...[vendored/generated files omitted: {omitted}]"
+    if truncated:
+        diff += f"\n...[diff truncated after {MAX_DIFF_BYTES // 1000} KB]"
+    return diff
+
+def _fetch_pr_diff(repo_name: str, pr_number: int, github_token: str) -> str:
+    """Fetches the raw diff straight from the pulls endpoint."""
+    headers = {'Authorization': f'token {github_token}', 'Accept': 'application/vnd.github.diff'}
+    with _session().get(f"{GITHUB_API_URL}/repos/{repo_name}/pulls/{pr_number}", headers=headers, stream=True) as response:
+        response.raise_for_status()
+        return _read_diff(response)
+
+@st.cache_data(ttl=300, show_spinner=False)
+def _fetch_pr(repo_name: str, pr_number: int, github_token: str) -> dict:
+    """Fetches title, body and diff for a PR, so Streamlit reruns don't hit GitHub again."""
+    key = (repo_name, pr_number, github_token)
+    cached = _DIFF_CACHE.get(key)
+    if cached is None:
+        # First look at this PR, so there's no head SHA to gate on: fetch both at once.
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            metadata_future = executor.submit(_fetch_pr_metadata, repo_name, pr_number, github_token)
+            diff_future = executor.submit(_fetch_pr_diff, repo_name, pr_number, github_token)
+            pr = metadata_future.result()
+            diff_content = diff_future.result()
+        # A push can land between the two responses, so this diff isn't known to match head.sha.
+        # Cache it unversioned: the next fetch takes the sequential path and re-downloads it.
+        diff_sha = None
+    else:
+        # A diff never changes for a given head commit; only refetch it when the head moved.
+        pr = _fetch_pr_metadata(repo_name, pr_number, github_token)
+        cached_sha, diff_content = cached
+        if cached_sha != pr['head']['sha']:
+            diff_content = _fetch_pr_diff(repo_name, pr_number, github_token)
+        diff_sha = pr['head']['sha']
+    _DIFF_CACHE.put(key, diff_sha, diff_content)
+    return {"title": pr['title'], "body": pr['body'], "diff": diff_content}
+
 @tool
 def get_pr_details_and_diff(repo_name: str, pr_number: int) -> str:
     """
     Gets the title, body, and code differences (diff) for a specific GitHub Pull Request.
     Use this as the first step to get the context of the changes.
     """
+    # Read on every call (a nanosecond lookup before network I/O) so re-saved keys apply immediately.
     github_token = os.getenv("GITHUB_TOKEN")
     if not github_token:
         return "Error: GITHUB_TOKEN environment variable not set. Please provide it in the sidebar."
     
     print(f"TOOL EXECUTED: Getting details for PR #{pr_number} in {repo_name}...")
     try:
-        g = Github(github_token) # Initialize client with the latest token
-        repo = g.get_repo(repo_name)
-        pr = repo.get_pull(pr_number)
-
-        headers = {'Authorization': f'token {github_token}'}
-        response = requests.get(pr.patch_url, headers=headers)
-        response.raise_for_status()
-        diff_content = response.text
+        pr = _fetch_pr(repo_name, pr_number, github_token)
 
-        return f"Title: {pr.title}\nBody: {pr.body}\n\nCode Diff:\n{diff_content}"
+        return f"Title: {pr['title']}\nBody: {pr['body']}\n\nCode Diff:\n{pr['diff']}"
     except Exception as e:
         return f"Error fetching PR details: {e}"
 
@@ -41,20 +211,22 @@ def post_comment_to_pr(repo_name: str, pr_number: int, comment_body: str) -> str
         
     print(f"TOOL EXECUTED: Posting comment to PR #{pr_number} in {repo_name}...")
     try:
-        g = Github(github_token) # Initialize client with the latest token
-        repo = g.get_repo(repo_name)
-        pr = repo.get_pull(pr_number)
-        pr.create_issue_comment(comment_body)
+        headers = {'Authorization': f'token {github_token}', 'Accept': 'application/vnd.github+json'}
+        response = _session().post(
+            f"{GITHUB_API_URL}/repos/{repo_name}/issues/{pr_number}/comments",
+            json={"body": comment_body},
+            headers=headers,
+        )
+        response.raise_for_status()
         return "Comment posted successfully."
     except Exception as e:
         return f"Error posting comment: {e}"
 
+_PR_URL_RE = re.compile(r"^https?://github\.com/(?P<owner>[^/]+)/(?P<repo>[^/]+)/pull/(?P<number>\d+)/?$")
+
 def parse_pr_url(url: str) -> tuple[str, int]:
     """Parses a GitHub PR URL into (repo_name, pr_number)."""
-    try:
-        parts = url.strip('/').split('/')
-        repo_name = f"{parts[-4]}/{parts[-3]}"
-        pr_number = int(parts[-1])
-        return repo_name, pr_number
-    except (IndexError, ValueError) as e:
-        raise ValueError(f"Invalid GitHub PR URL format: {url}") from e
\ No newline at end of file
+    match = _PR_URL_RE.match(url.strip())
+    if not match:
+        raise ValueError(f"Invalid GitHub PR URL format: {url}")
+    return f"{match['owner']}/{match['repo']}", int(match['number'])
\ No newline at end of file